@@ -19,26 +19,31 @@ class InterpPromptSequence:
         modifiers: The feature modifiers to use in the weighted interpolation.
         """
         # Calculate initial interpolation
-        self.positives = self._weightedInterpolation(
+        # Each sequence is a list of interpolated segments that are only concatenated once when needed
+        self.positives: list[torch.Tensor] = [self._weightedInterpolation(
             start.positive,
             end.positive,
             modifiers
-        )[0]
-        self.negatives = self._weightedInterpolation(
+        )[0]]
+        self.negatives: list[torch.Tensor] = [self._weightedInterpolation(
             start.negative,
             end.negative,
             modifiers
-        )[0]
-        self.positivePools = self._weightedInterpolation(
+        )[0]]
+        self.positivePools: list[torch.Tensor] = [self._weightedInterpolation(
             start.positivePool,
             end.positivePool,
             modifiers
-        )[0]
-        self.negativePools = self._weightedInterpolation(
+        )[0]]
+        self.negativePools: list[torch.Tensor] = [self._weightedInterpolation(
             start.negativePool,
             end.negativePool,
             modifiers
-        )[0]
+        )[0]]
+
+    # Python Functions
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.positives)
 
     # Functions
     def addToSequence(self, start: MbmPrompt, end: MbmPrompt, modifiers: torch.Tensor) -> None:
@@ -55,32 +60,34 @@ class InterpPromptSequence:
         self.positivePools = self._addToSequence(self.positivePools, start.positivePool, end.positivePool, modifiers)
         self.negativePools = self._addToSequence(self.negativePools, start.negativePool, end.negativePool, modifiers)
 
-    def _addToSequence(self, container: torch.Tensor, start: torch.Tensor, stop: torch.Tensor, modifiers: torch.Tensor) -> torch.Tensor:
+    def _addToSequence(self, container: list[torch.Tensor], start: torch.Tensor, stop: torch.Tensor, modifiers: torch.Tensor) -> list[torch.Tensor]:
         """
         Add an additional interpolated tensor to the sequence.
 
-        container: The tensor to add the interpolation to.
+        container: The list of segments to add the interpolation to.
         start: The tensor to start from.
         stop: The tensor to end on.
         modifiers: The feature modifiers to use in the weighted interpolation.
 
-        Returns the modified `container` tensor.
+        Returns the modified `container` list.
         """
         # Calculate the interpolation
         interp, shapeChanged = self._weightedInterpolation(
             start,
             stop,
             modifiers,
-            tokenCount=container.size(1)
+            tokenCount=container[0].size(1)
         )
         interp = interp[1:]
 
         # Check if shape updates are needed
         if shapeChanged:
-            container = self.addPromptTokens(container, interp.shape)
+            container = [self.addPromptTokens(segment, interp.shape) for segment in container]
+
+        # Add the interpolation to the container
+        container.append(interp)
 
-        # Create modified container with the interpolation
-        return torch.vstack((container, interp))
+        return container
 
     def trimToLength(self, length: int) -> None:
         """
@@ -88,25 +95,40 @@ class InterpPromptSequence:
 
         length: The length to trim the sequence to.
         """
-        self.positives = self.positives[:length]
-        self.negatives = self.negatives[:length]
-        self.positivePools = self.positivePools[:length]
-        self.negativePools = self.negativePools[:length]
+        self.positives = [self._joinSegments(self.positives)[:length]]
+        self.negatives = [self._joinSegments(self.negatives)[:length]]
+        self.positivePools = [self._joinSegments(self.positivePools)[:length]]
+        self.negativePools = [self._joinSegments(self.negativePools)[:length]]
 
     def asPromptSequence(self) -> list[MbmPrompt]:
         """
         Returns the sequence as a list of MbmPrompt objects.
         """
+        positives = self._joinSegments(self.positives)
+        negatives = self._joinSegments(self.negatives)
+        positivePools = self._joinSegments(self.positivePools)
+        negativePools = self._joinSegments(self.negativePools)
+
         return [
             MbmPrompt(
-                self.positives[i],
-                self.negatives[i],
-                positivePool=self.positivePools[i],
-                negativePool=self.negativePools[i]
+                positives[i],
+                negatives[i],
+                positivePool=positivePools[i],
+                negativePool=negativePools[i]
             )
-            for i in range(len(self.positives))
+            for i in range(len(positives))
         ]
 
+    def _joinSegments(self, segments: list[torch.Tensor]) -> torch.Tensor:
+        """
+        Joins the given interpolated segments into a single tensor.
+
+        segments: The segments to join.
+
+        Returns the joined tensor.
+        """
+        return segments[0] if (len(segments) == 1) else torch.cat(segments, dim=0)
+
     def _weightedInterpolation(self, start: torch.Tensor, stop: torch.Tensor, weights: torch.Tensor, tokenCount: int = -1) -> tuple[torch.Tensor, bool]:
         """
         Interpolates between `start` and `stop` based on the given `weights` for each step in the interpolation.
@@ -7,8 +7,8 @@ import io
 import torch
 import numpy as np
 import matplotlib.pyplot as plt
-from typing import Union
-from PIL import Image
+from typing import Optional, Union
+from PIL import Image, ImageDraw
 
 # Constants
 AUDIO_EXTENSIONS = ("wav", "mp3", "ogg", "flac")
@@ -17,6 +17,8 @@ AUDIO_INPUT_DIR = "audio"
 PROMPT_SEQ_EXTENSIONS = ("json", )
 PROMPT_SEQ_INPUT_DIR = "promptSequences"
 
+CHART_FIGSIZE = (20, 4) # Size in inches of charts rendered by `chartData`
+
 # Functions
 def fullpath(filepath: str) -> str:
     """
@@ -86,7 +88,7 @@ def chartData(data: Union[np.ndarray, torch.Tensor], title: str, dotValues: bool
     Returns a ComfyUI compatible Tensor image of the chart.
     """
     # Build the chart
-    fig, ax = plt.subplots(figsize=(20, 4))
+    fig, ax = plt.subplots(figsize=CHART_FIGSIZE)
     ax.plot(data)
     ax.grid(True)
 
@@ -99,3 +101,56 @@ def chartData(data: Union[np.ndarray, torch.Tensor], title: str, dotValues: bool
 
     # Render the chart
     return renderChart(fig)
+
+def chartImageSize() -> tuple[int, int]:
+    """
+    Returns the `(width, height)` in pixels of charts rendered by `chartData`.
+    """
+    dpi = plt.rcParams["savefig.dpi"]
+    if dpi == "figure":
+        dpi = plt.rcParams["figure.dpi"]
+
+    return (round(CHART_FIGSIZE[0] * dpi), round(CHART_FIGSIZE[1] * dpi))
+
+def fastLineChart(data: Union[np.ndarray, torch.Tensor], title: Optional[str] = None) -> torch.Tensor:
+    """
+    Draws a simple line chart of the provided data directly to an image without Matplotlib.
+    The image matches the size of `chartData` charts so they can be concatenated, but no axes or labels are included.
+
+    data: A numpy array or a Tensor to chart.
+    title: The title of the chart. Provide `None` to have no title.
+
+    Returns a ComfyUI compatible Tensor image of the chart.
+    """
+    # Prepare the data
+    values = data.detach().cpu().numpy() if isinstance(data, torch.Tensor) else np.asarray(data)
+    values = values.astype(np.float64).flatten()
+
+    # Build the blank chart
+    width, height = chartImageSize()
+    img = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+
+    # Add the title
+    top = 0
+    if title is not None:
+        titleBox = draw.textbbox((0, 0), title)
+        draw.text((((width - (titleBox[2] - titleBox[0])) / 2), 4), title, fill=(0, 0, 0))
+        top = (titleBox[3] - titleBox[1]) + 12
+
+    if len(values) > 1:
+        # Scale the data to pixel coordinates with the maximum at the top
+        xs = np.linspace(0, (width - 1), num=len(values))
+        valRange = values.max() - values.min()
+        if valRange > 0:
+            ys = top + ((values.max() - values) * ((height - 1 - top) / valRange))
+        else:
+            ys = np.full(len(values), (top + ((height - 1 - top) / 2)))
+
+        # Draw the line
+        draw.line(list(zip(xs.tolist(), ys.tolist())), fill=(0, 0, 255), width=2)
+
+    # Convert to an image tensor
+    return torch.from_numpy(
+        np.asarray(img).astype(np.float32) / 255.0
+    )[None,]
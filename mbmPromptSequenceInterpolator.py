@@ -100,7 +100,7 @@ class PromptSequenceInterpolator:
                     interpPromptSeq = InterpPromptSequence(curPrompt, nextPrompt, curModifiers)
                 else:
                     # Iterate the iter index
-                    interPromptStartIndex = len(interpPromptSeq.positives)
+                    interPromptStartIndex = len(interpPromptSeq)
 
                     # Expand prompt sequence
                     interpPromptSeq.addToSequence(curPrompt, nextPrompt, curModifiers)
@@ -110,29 +110,38 @@ class PromptSequenceInterpolator:
 
                 if i == (promptCount - 2):
                     # Mark the final prompt
-                    self._addPromptIndicator(promptChart, (i + 1), desiredFrames, len(interpPromptSeq.positives))
+                    self._addPromptIndicator(promptChart, (i + 1), desiredFrames, len(interpPromptSeq))
 
             # Trim off any extra frames produced from ceil to int
             interpPromptSeq.trimToLength(desiredFrames)
 
             # Build the prompt sequence
             promptSeq = interpPromptSeq.asPromptSequence()
+
+            # Calculate the mean of each prompt in a single reduction over the joined sequence tensors
+            # Trimming leaves each sequence as a single joined tensor
+            positiveMeans = interpPromptSeq.positives[0].flatten(start_dim=1).mean(dim=1)
+            negativeMeans = interpPromptSeq.negatives[0].flatten(start_dim=1).mean(dim=1)
         elif promptCount == 1:
             # Send it onward
             promptSeq = prompts
+
+            # Calculate the mean of the prompt
+            positiveMeans = torch.stack([torch.mean(pt.positive) for pt in promptSeq])
+            negativeMeans = torch.stack([torch.mean(pt.negative) for pt in promptSeq])
         else:
             # No prompts my guy
             raise ValueError("At least one prompt is required.")
 
         # Plot the prompt distribution
-        promptChart[1].plot(list(range(len(promptSeq))), normalizeArray([torch.mean(pt.positive) for pt in promptSeq]), label="Positive")
-        promptChart[1].plot(list(range(len(promptSeq))), normalizeArray([torch.mean(pt.negative) for pt in promptSeq]), label="Negative")
+        promptChart[1].plot(list(range(len(promptSeq))), normalizeArray(positiveMeans), label="Positive")
+        promptChart[1].plot(list(range(len(promptSeq))), normalizeArray(negativeMeans), label="Negative")
         promptChart[1].plot(list(range(len(promptSeq))), normalizeArray(feat_mods), label="Feature Modifiers", linestyle="dotted")
 
         # Render the charts
         chartImages = torch.vstack([
-            chartData([torch.mean(pt.positive) for pt in promptSeq], "Positive Prompt"),
-            chartData([torch.mean(pt.negative) for pt in promptSeq], "Negative Prompt"),
+            chartData(positiveMeans, "Positive Prompt"),
+            chartData(negativeMeans, "Negative Prompt"),
             self._renderPromptChart(promptChart)
         ])
 
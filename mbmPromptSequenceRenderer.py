@@ -6,12 +6,99 @@ import torch
 import random
 import numpy as np
 from tqdm import tqdm
+from contextlib import contextmanager
+from collections import OrderedDict
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional, fall back to plain Python
+    def njit(*args, **kwargs):
+        return (lambda func: func)
 
 import comfy.samplers
 from nodes import common_ksampler
 
 from .mbmPrompt import MbmPrompt
-from .mbmMVShared import chartData
+from .mbmMVShared import fastLineChart
+
+# Functions
+@contextmanager
+def fastCudaBackends():
+    """
+    Enables TF32 math and cuDNN benchmarking for the duration of the context.
+    The previous backend settings are restored on exit.
+    """
+    # Store the current settings
+    prevMatmulTf32 = torch.backends.cuda.matmul.allow_tf32
+    prevCudnnTf32 = torch.backends.cudnn.allow_tf32
+    prevCudnnBenchmark = torch.backends.cudnn.benchmark
+
+    try:
+        # Enable the faster settings
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.backends.cudnn.benchmark = True # The latent shape is the same every frame so the tuned algorithms are reused
+
+        yield
+    finally:
+        # Restore the previous settings
+        torch.backends.cuda.matmul.allow_tf32 = prevMatmulTf32
+        torch.backends.cudnn.allow_tf32 = prevCudnnTf32
+        torch.backends.cudnn.benchmark = prevCudnnBenchmark
+
+@njit(cache=True)
+def walkLatentSchedule(
+        mods: np.ndarray,
+        directions: np.ndarray,
+        modLimit: float,
+        initMean: float,
+        isBounce: bool
+    ) -> np.ndarray:
+    """
+    Walks the latent's mean through each hop while respecting the `modLimit`.
+    Compiled with Numba when it is available.
+
+    mods: The amount to modify the latent by for each frame.
+    directions: The direction (`1.0` or `-1.0`) of each hop. Ignored when `isBounce` is `True`.
+    modLimit: The maximum variation that can occur to the latent based on the latent's mean value. Must be `> 0`.
+    initMean: The mean value of the initial latent.
+    isBounce: If the direction should bounce between `modLimit` and `-modLimit`.
+
+    Returns an array with the value to add to every point in the latent for each frame.
+    """
+    frameCount = len(mods)
+    deltas = np.zeros(frameCount)
+    curMean = initMean
+    isBouncingUp = True
+    for i in range(frameCount):
+        modifier = mods[i]
+        direction = directions[i]
+
+        if isBounce:
+            # Increases to to the `modLimit`, then decreases to `-modLimit`, and loops as many times as needed building on the last latent
+            # Calculate the next value
+            nextValue = (curMean + modifier) if isBouncingUp else (curMean - modifier)
+
+            # Check if within bounds
+            if (-modLimit <= nextValue) and (nextValue <= modLimit):
+                # Within bounds
+                direction = 1.0 if isBouncingUp else -1.0
+            else:
+                # Outside of bounds
+                direction = -1.0 if isBouncingUp else 1.0
+                isBouncingUp = not isBouncingUp
+
+        # Check if mean will be exceeded
+        nextMean = curMean + (direction * modifier)
+        if ((direction > 0) and (nextMean > modLimit)) or ((direction < 0) and (nextMean < -modLimit)):
+            # Mean is exceeded so latent only
+            continue
+
+        deltas[i] = direction * modifier
+        curMean = nextMean
+
+    return deltas
 
 # Classes
 class PromptSequenceRenderer:
@@ -31,8 +118,12 @@ class PromptSequenceRenderer:
     LATENT_MODE_GAUSS = "guassian"
     LATENT_MODE_BOUNCE = "bounce"
 
-    FEAT_APPLY_METHOD_ADD = "add"
-    FEAT_APPLY_METHOD_SUBTRACT = "subtract"
+    PROGRESS_INFO_INTERVAL = 8 # Number of frames between progress bar info updates
+    SAMPLE_CACHE_SIZE = 8 # Number of recently sampled frames to keep for reuse when identical frames are rendered
+
+    PRECISION_FP32 = "fp32"
+    PRECISION_BF16 = "bf16"
+    PRECISION_FP16 = "fp16"
 
     RETURN_TYPES = ("LATENT", "IMAGE")
     RETURN_NAMES = ("LATENTS", "CHARTS")
@@ -41,7 +132,8 @@ class PromptSequenceRenderer:
 
     # Constructor
     def __init__(self):
-        self.__isBouncingUp = True # Used when `bounce` mode is used to track direction
+        self.__latentGenerator = torch.Generator(device="cpu") # Used when `guassian` mode is used to create new latents
+        self.__seedRandom = random.Random() # Used when `random` seed mode is used to pick seeds
 
     # ComfyUI Functions
     @classmethod
@@ -65,6 +157,10 @@ class PromptSequenceRenderer:
                 "sampler_name": (comfy.samplers.KSampler.SAMPLERS, ),
                 "scheduler": (comfy.samplers.KSampler.SCHEDULERS, ),
                 "denoise": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+            },
+            "optional": {
+                "batch_size": ("INT", {"default": 1, "min": 1, "max": 4096}), # The maximum number of frames sharing a prompt to render in a single sampler call. Only used with the `fixed` Seed Mode. Batched frames share the same initial noise as individual renders, but ancestral and SDE samplers may produce slightly different images
+                "precision": ([s.PRECISION_FP32, s.PRECISION_BF16, s.PRECISION_FP16], ), # The precision to autocast sampling to when using CUDA. `bf16` is preferred on Ampere or newer GPUs
             }
         }
 
@@ -84,12 +180,10 @@ class PromptSequenceRenderer:
             sampler_name: str,
             scheduler: str,
             denoise: float,
+            batch_size: int = 1,
+            precision: str = PRECISION_FP32
         ):
         ## Setup
-        # Set the random library seeds
-        random.seed(seed)
-        np.random.default_rng(seed)
-
         # Get the counts
         desiredFrames = len(prompts)
 
@@ -103,74 +197,177 @@ class PromptSequenceRenderer:
             raise ValueError("At least one prompt is required.")
 
         ## Generation
-        # Reset the bounce direction
-        self.__isBouncingUp = True
+        # Extract the latent modifiers once to avoid Tensor dispatch on every scalar use
+        latentMods = latent_mods.detach().cpu().numpy().astype(np.float64)
 
-        # Set the initial prompt
-        promptPos = prompts[0].positivePrompt()
-        promptNeg = prompts[0].negativePrompt()
+        # Seed the random seed picker if it will be used
+        if seed_mode == self.SEED_MODE_RANDOM:
+            self.__seedRandom.seed(seed)
 
-        # Prepare latent output tensor
-        outputTensor: torch.Tensor = None
-        latentTensorMeans = np.zeros(desiredFrames)
-        latentTensor = latent_image["samples"].clone()
-        for i in (pbar := tqdm(range(desiredFrames), desc="Rendering Sequence")):
-            # Calculate the latent tensor
-            latentTensor = self._iterateLatentByMode(
-                latentTensor,
-                latent_mode,
-                latent_mod_limit,
-                latent_mods[i]
-            )
-
-            # Records the latent tensor's mean
-            latentTensorMeans[i] = torch.mean(latentTensor).numpy()
-
-            # Set progress bar info
-            pbar.set_postfix({
-                "mod": f"{latent_mods[i]:.2f}",
-                "prompt": f"{torch.mean(promptPos[0][0]):.4f}",
-                "latent": f"{latentTensorMeans[i]:.2f}"
-            })
-
-            # Generate the image
-            imgTensor = common_ksampler(
-                model,
-                seed,
-                steps,
-                cfg,
-                sampler_name,
-                scheduler,
-                promptPos,
-                promptNeg,
-                {"samples": latentTensor}, # ComfyUI, why package it?
-                denoise=denoise
-            )[0]["samples"]
-
-            if outputTensor is None:
-                outputTensor = imgTensor
-            else:
-                outputTensor = torch.vstack((
-                    outputTensor,
-                    imgTensor
-                ))
+        # Build each distinct prompt once
+        promptConds, promptCondIndices = self._buildPromptConditionings(prompts)
 
-            # Limit if one if supplied
-            if (image_limit > 0) and (i >= (image_limit - 1)):
-                break
+        # Calculate how many frames will be rendered
+        renderFrames = min(desiredFrames, image_limit) if (image_limit > 0) else desiredFrames
 
-            # Iterate seed as needed
-            seed = self._iterateSeedByMode(seed, seed_mode)
+        # Prepare latent output tensor
+        latentTensorMeans = np.zeros(desiredFrames)
+        latentTensor = latent_image["samples"].to(model.load_device, copy=True) # Kept on the model's device so the sampler does not copy it every frame
+        latentMean = torch.mean(latentTensor).item() # Tracked as a running value to avoid a reduction every frame
+        latentBatch = latentTensor.shape[0]
+        if self.__latentGenerator.device != latentTensor.device:
+            # Generators must be on the same device as the latent
+            self.__latentGenerator = torch.Generator(device=latentTensor.device)
+
+        self.__latentGenerator.manual_seed(seed)
+
+        # Decide on the sampling precision
+        # Only autocast when sampling happens on CUDA
+        autocastDtype = torch.bfloat16 if (precision == self.PRECISION_BF16) else torch.float16
+        useAutocast = (precision != self.PRECISION_FP32) and latentTensor.is_cuda
+
+        # Plan the change to the latent for each frame
+        latentDeltas = self._planLatentSchedule(
+            latentMods[:renderFrames],
+            latent_mode,
+            latent_mod_limit,
+            latentMean,
+            seed
+        )
 
-            # Iterate the prompts as needed
-            if (desiredFrames > 1) and ((i + 1) < desiredFrames):
-                promptPos = prompts[i + 1].positivePrompt()
-                promptNeg = prompts[i + 1].negativePrompt()
+        outputTensor: torch.Tensor = None # Allocated after the first image is generated
+        latentVersion = 0 # Increased every time the latent changes
+        useSampleCache = (seed_mode == self.SEED_MODE_FIXED) # Frames can only be reused when the seed never changes
+        sampleCache = OrderedDict() # Recently sampled frames keyed by their prompt and latent version
+        promptMeans = {} # Mean of each distinct positive prompt, calculated when first displayed
+        nextProgressInfoFrame = 0
+        i = 0
+        with torch.inference_mode(), fastCudaBackends(), tqdm(total=renderFrames, desc="Rendering Sequence") as pbar:
+            while i < renderFrames:
+                # Group frames sharing a prompt into a single sampler call when the seed does not change between them
+                runLength = 1
+                if seed_mode == self.SEED_MODE_FIXED:
+                    while (runLength < batch_size) and ((i + runLength) < renderFrames) and (promptCondIndices[i + runLength] == promptCondIndices[i]):
+                        runLength += 1
+
+                promptPos, promptNeg = promptConds[promptCondIndices[i]]
+
+                # Calculate the latent tensor for each frame in the run
+                if runLength > 1:
+                    runLatent = torch.empty(
+                        (runLength * latentBatch, *latentTensor.shape[1:]),
+                        dtype=latentTensor.dtype,
+                        device=latentTensor.device
+                    )
+
+                runKeys = []
+                sampleKeys = [] # Keys of the frames in the run that need to be sampled
+                runImages = {} # Images for each key in the run
+                for j in range(i, (i + runLength)):
+                    # Calculate the latent tensor
+                    latentDelta = latentDeltas[j]
+                    if np.isnan(latentDelta):
+                        # Create a new latent
+                        latentTensor = self._createLatent(latentTensor.shape, latentTensor.device, latentTensor.dtype)
+                        latentMean = torch.mean(latentTensor).item()
+                        latentVersion += 1
+                    elif latentDelta != 0:
+                        # Shifting every point shifts the mean by the same amount
+                        latentTensor.add_(latentDelta)
+                        latentMean += latentDelta
+                        latentVersion += 1
+
+                    # Records the latent tensor's mean
+                    latentTensorMeans[j] = latentMean
+
+                    # Check if this frame has already been sampled
+                    frameKey = (promptCondIndices[j], latentVersion)
+                    runKeys.append(frameKey)
+                    if (frameKey in sampleKeys) or (frameKey in runImages):
+                        continue
+
+                    if useSampleCache and (frameKey in sampleCache):
+                        # Identical inputs produce an identical image so reuse it
+                        runImages[frameKey] = sampleCache[frameKey]
+                        sampleCache.move_to_end(frameKey)
+                        continue
+
+                    # Snapshot the latent since it is modified in place
+                    if runLength > 1:
+                        runLatent[(len(sampleKeys) * latentBatch):((len(sampleKeys) + 1) * latentBatch)].copy_(latentTensor)
+
+                    sampleKeys.append(frameKey)
+
+                # Set progress bar info periodically
+                if i >= nextProgressInfoFrame:
+                    condIndex = promptCondIndices[i]
+                    if condIndex not in promptMeans:
+                        promptMeans[condIndex] = torch.mean(promptPos[0][0]).item()
+
+                    pbar.set_postfix({
+                        "mod": f"{latentMods[i + runLength - 1]:.2f}",
+                        "prompt": f"{promptMeans[condIndex]:.4f}",
+                        "latent": f"{latentTensorMeans[i + runLength - 1]:.2f}"
+                    })
+                    nextProgressInfoFrame = i + self.PROGRESS_INFO_INTERVAL
+
+                # Generate the images
+                if len(sampleKeys) > 0:
+                    if runLength > 1:
+                        # Give every frame the same initial noise an individual render with the same seed would use
+                        # Ancestral and SDE samplers draw additional noise per step across the whole batch, so batched frames will not be bit-identical to individual renders
+                        samplerLatent = {
+                            "samples": runLatent[:(len(sampleKeys) * latentBatch)],
+                            "batch_index": (list(range(latentBatch)) * len(sampleKeys))
+                        }
+                    else:
+                        samplerLatent = {"samples": latentTensor} # ComfyUI, why package it?
+
+                    with torch.autocast("cuda", dtype=autocastDtype, enabled=useAutocast):
+                        imgTensor = common_ksampler(
+                            model,
+                            seed,
+                            steps,
+                            cfg,
+                            sampler_name,
+                            scheduler,
+                            promptPos,
+                            promptNeg,
+                            samplerLatent,
+                            denoise=denoise
+                        )[0]["samples"]
+
+                    # Allocate the output tensor once the output shape is known
+                    if outputTensor is None:
+                        outputTensor = torch.empty(
+                            (renderFrames * latentBatch, *imgTensor.shape[1:]),
+                            dtype=imgTensor.dtype,
+                            device=imgTensor.device
+                        )
+
+                    # Split out each sampled frame
+                    for k, frameKey in enumerate(sampleKeys):
+                        runImages[frameKey] = imgTensor[(k * latentBatch):((k + 1) * latentBatch)]
+
+                        if useSampleCache:
+                            # Remember the frame while evicting the least recently used frames
+                            sampleCache[frameKey] = runImages[frameKey]
+                            if len(sampleCache) > self.SAMPLE_CACHE_SIZE:
+                                sampleCache.popitem(last=False)
+
+                # Write the images into their slots
+                for k, frameKey in enumerate(runKeys):
+                    outputTensor[((i + k) * latentBatch):((i + k + 1) * latentBatch)].copy_(runImages[frameKey])
+
+                # Iterate seed as needed
+                for _ in range(runLength):
+                    seed = self._iterateSeedByMode(seed, seed_mode)
+
+                i += runLength
+                pbar.update(runLength)
 
         # Render charts
-        chartImages = torch.vstack([
-            chartData(latentTensorMeans, "Latent Means")
-        ])
+        chartImages = fastLineChart(latentTensorMeans, "Latent Means")
 
         # Return outputs
         return (
@@ -179,112 +376,98 @@ class PromptSequenceRenderer:
         )
 
     # Internal Functions
-    def _iterateLatentByMode(self,
-            latent: torch.Tensor,
+    def _buildPromptConditionings(self, prompts: list[MbmPrompt]) -> tuple[list[tuple[list, list]], list[int]]:
+        """
+        Builds the ComfyUI compatible prompts for each distinct prompt in the sequence.
+        Prompts are considered the same if they share the same underlying tensor objects.
+
+        prompts: The prompt sequence.
+
+        Returns a tuple of:
+        * A list of `(positive, negative)` ComfyUI compatible prompts for each distinct prompt.
+        * A list with the index into the distinct prompts for each prompt in the sequence.
+        """
+        conds = []
+        condIndices = []
+        seen = {}
+        for prompt in prompts:
+            # Check if this prompt has already been built
+            key = (id(prompt.positive), id(prompt.positivePool), id(prompt.negative), id(prompt.negativePool))
+            if key not in seen:
+                # Build the new prompt
+                seen[key] = len(conds)
+                conds.append((prompt.positivePrompt(), prompt.negativePrompt()))
+
+            condIndices.append(seen[key])
+
+        return (conds, condIndices)
+
+    def _planLatentSchedule(self,
+            mods: np.ndarray,
             latentMode: str,
             modLimit: float,
-            modifier: float
-        ) -> torch.Tensor:
+            initMean: float,
+            seed: int
+        ) -> np.ndarray:
         """
-        Produces a latent tensor based on the provided mode.
+        Plans the change applied to the latent for each frame based on the provided mode.
+        Only the latent's mean is needed to decide each change, so the full schedule can be calculated before any rendering happens.
 
-        latent: The latent tensor to modify.
+        mods: The amount to modify the latent by for each frame.
         latentMode: The mode to iterate by.
         modLimit: The maximum variation that can occur to the latent based on the latent's mean value. Provide `<= 0` to have no limit.
-        modifier: The amount to modify the latent by each hop.
+        initMean: The mean value of the initial latent.
+        seed: The seed used to decide the direction of each hop in `flow` mode.
 
-        Returns the iterated latent tensor.
+        Returns an array with the value to add to every point in the latent for each frame. A `NaN` value indicates a new latent should be created instead.
         """
-        # Decide what to do if in flow mode
-        if latentMode == self.LATENT_MODE_FLOW:
-            # Each hop will add or subtract, based on the audio features, from the last latent
-            if random.random() < 0.5:
-                latentMode = self.LATENT_MODE_INCREASE
-            else:
-                latentMode = self.LATENT_MODE_DECREASE
+        frameCount = len(mods)
 
-        if latentMode == self.LATENT_MODE_BOUNCE:
-            # Increases to to the `modLimit`, then decreases to `-modLimit`, and loops as many times as needed building on the last latent
-            if modLimit > 0:
-                # Do the bounce operation
-                # Calculate the next value
-                curLatentMean = torch.mean(latent)
-                nextValue = (curLatentMean + modifier) if self.__isBouncingUp else (curLatentMean - modifier)
-
-                # Check if within bounds
-                if -modLimit <= nextValue <= modLimit:
-                    # Within bounds
-                    latentMode = self.LATENT_MODE_INCREASE if self.__isBouncingUp else self.LATENT_MODE_DECREASE
-                else:
-                    # Outside of bounds
-                    latentMode = self.LATENT_MODE_DECREASE if self.__isBouncingUp else self.LATENT_MODE_INCREASE
-                    self.__isBouncingUp = not self.__isBouncingUp
-            else:
-                # No limit so just increase
-                latentMode = self.LATENT_MODE_INCREASE
+        # Handle the modes that do not depend on the features
+        if latentMode == self.LATENT_MODE_GAUSS:
+            # Each hop creates a new latent with guassian noise
+            return np.full(frameCount, np.nan)
+        elif latentMode == self.LATENT_MODE_STATIC:
+            # Only the provided latent is used ignoring audio features
+            return np.zeros(frameCount)
 
-        # Decide what to do based on mode
-        if latentMode == self.LATENT_MODE_INCREASE:
-            # Each hop adds, based on the audio features, to the last latent
-            return self._applyFeatToLatent(latent, self.FEAT_APPLY_METHOD_ADD, modLimit, modifier)
+        # Decide the direction of each hop
+        if latentMode == self.LATENT_MODE_FLOW:
+            # Each hop will add or subtract, based on the audio features, from the last latent
+            directions = np.random.Generator(np.random.PCG64(seed)).choice([-1.0, 1.0], size=frameCount)
         elif latentMode == self.LATENT_MODE_DECREASE:
             # Each hop subtracts, based on the audio features, from the last latent
-            return self._applyFeatToLatent(latent, self.FEAT_APPLY_METHOD_SUBTRACT, modLimit, modifier)
-        elif latentMode == self.LATENT_MODE_GAUSS:
-            # Each hop creates a new latent with guassian noise
-            return self._createLatent(latent.shape)
-        else: # LATENT_MODE_STATIC
-            # Only the provided latent is used ignoring audio features
-            return latent
+            directions = np.full(frameCount, -1.0)
+        else: # LATENT_MODE_INCREASE, LATENT_MODE_BOUNCE
+            # Each hop adds, based on the audio features, to the last latent
+            directions = np.ones(frameCount)
+
+        # Check if the limit needs to be tracked
+        if modLimit <= 0:
+            # No limit so every hop is applied
+            return directions * mods
+
+        # Walk the latent's mean through each hop
+        return walkLatentSchedule(
+            np.ascontiguousarray(mods, dtype=np.float64),
+            directions,
+            float(modLimit),
+            float(initMean),
+            (latentMode == self.LATENT_MODE_BOUNCE)
+        )
 
-    def _createLatent(self, size: tuple) -> torch.Tensor:
+    def _createLatent(self, size: tuple, device: torch.device, dtype: torch.dtype) -> torch.Tensor:
         """
         Creates a latent tensor from normal distribution noise.
 
         size: The size of the latent tensor.
+        device: The device to create the latent tensor on.
+        dtype: The data type of the latent tensor.
 
         Returns the latent tensor.
         """
         # TODO: More specific noise range input?
-        return torch.tensor(np.random.normal(3, 2.5, size=size))
-
-    def _applyFeatToLatent(self,
-            latent: torch.Tensor,
-            method: str,
-            modLimit: float,
-            modifier: float
-        ) -> torch.Tensor:
-        """
-        Applys the provided features to the latent tensor.
-
-        latent: The latent tensor to modify.
-        method: The method to use to apply the features.
-        modLimit: The maximum variation that can occur to the latent based on the latent's mean value. Provide `<= 0` to have no limit.
-        modifier: The amount to modify the latent by each hop.
-
-        Returns the modified latent tensor.
-        """
-        # Apply features to every point in the latent
-        if method == self.FEAT_APPLY_METHOD_ADD:
-            # Add the features to the latent
-            # Check if mean will be exceeded
-            if (modLimit > 0) and (torch.mean(latent) + modifier) > modLimit:
-                # Mean is exceeded so latent only
-                return latent
-
-            # Add the features to the latent
-            latent += modifier
-        else: # FEAT_APPLY_METHOD_SUBTRACT
-            # Subtract the features from the latent
-            # Check if mean will be exceeded
-            if (modLimit > 0) and (torch.mean(latent) - modifier) < -modLimit:
-                # Mean is exceeded so latent only
-                return latent
-
-            # Subtract the features from the latent
-            latent -= modifier
-
-        return latent
+        return torch.empty(size, device=device, dtype=dtype).normal_(mean=3.0, std=2.5, generator=self.__latentGenerator)
 
     def _iterateSeedByMode(self, seed: int, seedMode: str):
         """
@@ -297,7 +480,7 @@ class PromptSequenceRenderer:
         """
         if seedMode == self.SEED_MODE_RANDOM:
             # Seed is random every hop
-            return random.randint(0, 0xffffffffffffffff)
+            return self.__seedRandom.randint(0, 0xffffffffffffffff)
         elif seedMode == self.SEED_MODE_INCREASE:
             # Seed increases by 1 every hop
             return seed + 1